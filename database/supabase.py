@@ -40,5 +40,10 @@ class Supabase:
 
         self._client = create_client(url, key)
 
-    def __getattr__(self, name: str):
-        return getattr(self._client, name)
+    @property
+    def client(self) -> Client:
+        """
+        The underlying Supabase client.
+        """
+
+        return self._client
@@ -7,6 +7,8 @@ import logging
 from pathlib import Path
 from typing import Union
 
+from file_to_vec.hashing import new_hasher
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,6 +22,8 @@ class ContentExtractor:
     returning an empty string in case of failures.
     """
 
+    HASH_BLOCK_SIZE = 1 << 20
+
     def __init__(self):
         self.logger = logger.getChild(self.__class__.__name__)
 
@@ -35,25 +39,66 @@ class ContentExtractor:
             str: The contents of the file, or empty string if reading fails
         """
 
-        return cls()._extract_impl(file_path)
+        extractor = cls()
+        return extractor._decode_impl(
+            extractor._read_bytes_impl(file_path),
+            file_path,
+        )
+
+    @classmethod
+    def hash_file(cls, file_path: Union[str, Path]) -> str:
+        """
+        Hash the raw contents of a file without loading it into memory at
+        once.
+
+        Args:
+            file_path (Union[str, Path]): Path to the file to hash
 
-    def _extract_impl(self, file_path: Union[str, Path]) -> str:
+        Returns:
+            str: The hex digest of the file, or empty string if reading
+                 fails
+        """
+
+        return cls()._hash_file_impl(file_path)
+
+    def _read_bytes_impl(self, file_path: Union[str, Path]) -> bytes:
+        # Read the whole file in one go and decode it in memory, so falling
+        # back to another encoding doesn't need a second read from disk.
         try:
-            with open(file_path, "r", encoding="utf-8") as file:
-                return file.read()
-        except UnicodeDecodeError:
-            self.logger.warning(
-                f"Could not read {file_path} as UTF-8, trying ISO-8859-1"
-            )
-            try:
-                with open(file_path, "r", encoding="ISO-8859-1") as file:
-                    return file.read()
-            except IOError as e:
-                self.logger.error(f"Could not read file {file_path}: {e}")
-                return ""
+            return Path(file_path).read_bytes()
+        except FileNotFoundError:
+            self.logger.error(f"File not found - {file_path}")
+            return b""
+        except IOError as e:
+            self.logger.error(f"Unexpected error reading {file_path}: {e}")
+            return b""
+
+    def _hash_file_impl(self, file_path: Union[str, Path]) -> str:
+        file_hash = new_hasher()
+        try:
+            with open(file_path, "rb") as file:
+                while block := file.read(self.HASH_BLOCK_SIZE):
+                    file_hash.update(block)
         except FileNotFoundError:
             self.logger.error(f"File not found - {file_path}")
             return ""
         except IOError as e:
             self.logger.error(f"Unexpected error reading {file_path}: {e}")
             return ""
+
+        return file_hash.hexdigest()
+
+    def _decode_impl(self, data: bytes, file_path: Union[str, Path]) -> str:
+        try:
+            text = data.decode("utf-8")
+        except UnicodeDecodeError:
+            self.logger.warning(
+                f"Could not read {file_path} as UTF-8, trying ISO-8859-1"
+            )
+            text = data.decode("ISO-8859-1")
+
+        # Translate newlines the way reading in text mode would.
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+        return text
@@ -17,17 +17,24 @@ Typical usage:
     chunks = await chunker.process("path/to/file.md", processor)
 """
 
-import hashlib
 import logging
 import os
-from typing import Callable, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 from file_to_vec import ContentExtractor
+from file_to_vec.hashing import hash_text
 from file_to_vec.splitters import MarkdownSplitter
 from settings import settings
 
 logger = logging.getLogger(__name__)
 
+AUTHOR_NAME = os.environ.get("AUTHOR_NAME")
+
+# Splitters are stateless, so one instance per file type is shared across all
+# files instead of constructing a new one for every file.
+_SPLITTERS: Dict[str, Callable] = {}
+
+
 class UnsupportedFileTypeError(ValueError):
     """
     Raised when attempting to process a file type that doesn't have a
@@ -48,9 +55,11 @@ class FileToChunks:
         self.logger = logger.getChild(self.__class__.__name__)
         self.database_service = database_service
 
-    @staticmethod
-    def _hash_text(text: str) -> str:
-        return hashlib.md5(text.encode("utf-8")).hexdigest()
+        # Content hashes of the chunks each file in progress is processing,
+        # by file path. Files processed concurrently all check the database
+        # before any of them has inserted, so a chunk they share is only
+        # processed by the file that claims it first.
+        self._claimed_hashes: Dict[str, Set[str]] = {}
 
     async def process(
         self,
@@ -59,9 +68,24 @@ class FileToChunks:
     ) -> List[dict]:
         """
         Process a file into chunks with deduplication.
+
+        Files whose contents haven't changed since they were last stored are
+        skipped before splitting. Each returned chunk carries the hash of the
+        whole file as `file_hash`.
+
+        The content hashes of the returned chunks stay claimed for the file
+        until release_claims is called, once they are stored.
         """
 
-        content, splitter = self._prepare_file_content(file_path)
+        file_hash, splitter = self._prepare_file(file_path)
+        if not file_hash:
+            return []
+
+        if self.database_service.get_file_hash_by_path(file_path) == file_hash:
+            self.logger.info("Skipping unchanged file %s", file_path)
+            return []
+
+        content = ContentExtractor.extract(file_path)
         if not content or len(content) <= 5:
             return []
 
@@ -69,8 +93,12 @@ class FileToChunks:
         if not chunks:
             return []
 
-        chunks_to_process = self._filter_chunks_for_processing(chunks)
+        for chunk in chunks:
+            chunk["file_hash"] = file_hash
+
+        chunks_to_process = self._filter_chunks_for_processing(file_path, chunks)
         if not chunks_to_process:
+            self.database_service.set_file_hash_by_path(file_path, file_hash)
             return []
 
         return await processor.process_chunks(
@@ -79,15 +107,15 @@ class FileToChunks:
             self._is_written_by_me(file_path),
         )
 
-    def _prepare_file_content(
+    def _prepare_file(
         self,
         file_path: str,
     ) -> Tuple[str, Optional[Callable]]:
         try:
             file_type = file_path.split(".")[-1]
             splitter = self._get_splitter(file_type)
-            content = ContentExtractor.extract(file_path)
-            return content, splitter
+            file_hash = ContentExtractor.hash_file(file_path)
+            return file_hash, splitter
         except UnsupportedFileTypeError as e:
             self.logger.error(
                 "Failed to process %s: %s",
@@ -103,45 +131,78 @@ class FileToChunks:
         content: str,
     ) -> List[dict]:
         chunks = splitter(content)
-        chunk_hashes = {self._hash_text(chunk["content"]) for chunk in chunks}
+        # Hash each chunk once and carry it along, so later stages don't
+        # have to encode and hash the same content again.
+        for chunk in chunks:
+            chunk["content_hash"] = hash_text(chunk["content"])
+        chunk_hashes = {chunk["content_hash"] for chunk in chunks}
 
         existing_chunk_hashes = self.database_service.get_hashes_by_path(
             file_path,
         )
-        for ech in existing_chunk_hashes:
-            if ech["content_hash"] not in chunk_hashes:
-                self.database_service.delete_by_content_hash(
-                    file_path,
-                    ech["content_hash"],
-                )
+        stale_hashes = [
+            ech["content_hash"]
+            for ech in existing_chunk_hashes
+            if ech["content_hash"] not in chunk_hashes
+        ]
+        if stale_hashes:
+            self.database_service.delete_by_content_hashes(
+                file_path,
+                stale_hashes,
+            )
 
         return chunks
 
+    def release_claims(self, file_path: str):
+        """
+        Release the content hashes claimed for a file, once its chunks are
+        stored or its processing failed.
+        """
+
+        self._claimed_hashes.pop(file_path, None)
+
     def _filter_chunks_for_processing(
         self,
+        file_path: str,
         chunks: List[dict],
     ) -> List[dict]:
-        chunks_not_in_db = []
-        for chunk in chunks:
-            persisted = self.database_service.content_exists_in_database(
-                chunk["content"],
-            )
-            if persisted:
-                continue
-            chunks_not_in_db.append(chunk)
+        existing_hashes = self.database_service.get_existing_hashes(
+            [chunk["content_hash"] for chunk in chunks],
+        )
+        existing_hashes.update(
+            content_hash
+            for path, claimed in self._claimed_hashes.items()
+            if path != file_path
+            for content_hash in claimed
+        )
 
-        return chunks_not_in_db
+        chunks_to_process = [
+            chunk for chunk in chunks if chunk["content_hash"] not in existing_hashes
+        ]
+        # There's no await between the lookup and the claim, so no other file
+        # can claim the same hashes in between.
+        self._claimed_hashes[file_path] = {
+            chunk["content_hash"] for chunk in chunks_to_process
+        }
+        return chunks_to_process
 
     @staticmethod
     def _is_written_by_me(file_path: str) -> bool:
-        return os.environ.get("AUTHOR_NAME") in file_path.split("/")
+        return AUTHOR_NAME in file_path.split("/")
 
     @staticmethod
     def _get_splitter(file_type: str) -> Callable:
+        splitter = _SPLITTERS.get(file_type)
+        if splitter is not None:
+            return splitter
+
         match file_type:
             case "md":
-                return MarkdownSplitter()
+                splitter = MarkdownSplitter()
             case _:
                 raise UnsupportedFileTypeError(
                     f"File type '{file_type}' is not supported.",
                 )
+
+        _SPLITTERS[file_type] = splitter
+        return splitter
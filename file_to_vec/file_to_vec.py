@@ -4,8 +4,8 @@ database. Supports different file types with customizable splitting strategies
 and processing pipelines.
 """
 
-import hashlib
 import logging
+from typing import List
 
 from file_to_vec import FileToChunks
 
@@ -38,10 +38,6 @@ class FileToVec:
         await file_to_vec("path/to/file.md", processor, db, ollama)
     """
 
-    @staticmethod
-    def _hash_text(text: str) -> str:
-        return hashlib.md5(text.encode("utf-8")).hexdigest()
-
     def __init__(self, database_service):
         self.logger = logger.getChild(self.__class__.__name__)
         self.database_service = database_service
@@ -77,18 +73,43 @@ class FileToVec:
         if db_table is not None:
             self.database_service.set_db_table(db_table)
 
-        chunks = await self.file_to_chunks.process(file_path, processor)
-        if chunks is None or chunks is False:
-            return False
+        try:
+            chunks = await self.file_to_chunks.process(file_path, processor)
+            if chunks is None or chunks is False:
+                return False
+            if not chunks:
+                return True
+
+            await self._embed_chunks(chunks, ollama)
 
-        for chunk in chunks:
-            chunk["embedding"] = await ollama.get_embeddings(
-                chunk["full_context"],
-            )
-            chunk["metadata"]["file_path"] = file_path
+            for chunk in chunks:
+                chunk["metadata"]["file_path"] = file_path
 
-            processed = self.database_service.insert(chunk)
+            processed = self.database_service.insert_many(chunks)
             if not processed:
                 raise FailedToProcessFileError(f"Failed to process {file_path}")
+        finally:
+            # Once stored, the chunks are found in the database instead.
+            self.file_to_chunks.release_claims(file_path)
+
+        # Only mark the file as up to date once all of its new chunks are
+        # stored, so a failed run is retried instead of skipped.
+        self.database_service.set_file_hash_by_path(
+            file_path,
+            chunks[0]["file_hash"],
+        )
 
         return True
+
+    @staticmethod
+    async def _embed_chunks(chunks: List[dict], ollama):
+        """
+        Generate the embeddings of all chunks with batched requests to
+        Ollama, instead of one request per chunk.
+        """
+
+        embeddings = await ollama.get_embeddings_many(
+            [chunk["full_context"] for chunk in chunks],
+        )
+        for chunk, embedding in zip(chunks, embeddings):
+            chunk["embedding"] = embedding
@@ -0,0 +1,61 @@
+"""
+Hashing helpers used to fingerprint chunk and file contents for
+deduplication.
+
+All content hashes stored in the database are produced here, so changing the
+algorithm only needs to happen in one place. The algorithm is picked with the
+`hash_algorithm` setting; every supported algorithm yields a 128-bit digest
+(32 hex characters). Changing it invalidates the hashes of rows that are
+already stored, so those files are reprocessed on the next run.
+"""
+
+import hashlib
+from functools import partial
+
+import xxhash
+
+from settings import settings
+
+# Incremental hasher constructor for each supported algorithm. md5 is kept for
+# tables that were filled before the switch to xxh128.
+HASHERS = {
+    "xxh128": xxhash.xxh128,
+    "blake2b": partial(hashlib.blake2b, digest_size=16),
+    "md5": hashlib.md5,
+}
+
+HASH_ALGORITHM = settings.get("hash_algorithm", "xxh128")
+if HASH_ALGORITHM not in HASHERS:
+    raise ValueError(
+        f"Unsupported hash_algorithm '{HASH_ALGORITHM}', "
+        f"expected one of: {', '.join(HASHERS)}",
+    )
+
+_new_hasher = HASHERS[HASH_ALGORITHM]
+
+
+def hash_bytes(data: bytes) -> str:
+    """
+    Return the hex digest of the given bytes.
+    """
+
+    if HASH_ALGORITHM == "xxh128":
+        return xxhash.xxh128_hexdigest(data)
+    return _new_hasher(data).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    """
+    Return the hex digest of the UTF-8 encoding of the given text.
+    """
+
+    return hash_bytes(text.encode("utf-8"))
+
+
+def new_hasher():
+    """
+    Return an incremental hasher whose hexdigest() matches hash_bytes for the
+    same input.
+    """
+
+    return _new_hasher()
@@ -1,7 +1,13 @@
+import asyncio
+import logging
 import math
 import os
 from typing import List
 
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
 
 class ChunkSummarizer:
     """
@@ -51,22 +57,23 @@ class ChunkSummarizer:
     CHUNKS_TO_USE_FOR_FILE_SUMMARY = 4
 
     def __init__(self, llm_service, model_name = None):
+        self.logger = logger.getChild(self.__class__.__name__)
         self.model_name = model_name
         if model_name is None:
             self.model_name = os.environ.get("SUMMARIZING_MODEL")
 
         self.llm_service = llm_service
 
+        # The author details don't change while the app is running, so
+        # resolve them and the prompt built from them only once.
+        self.author_full_name = os.environ.get("AUTHOR_FULL_NAME", "")
+        self.author_pronoun_two = os.environ.get("AUTHOR_PRONOUN_TWO", "")
+        self.written_by_me_prompt = self._parse_written_by_me_prompt()
+
     def _parse_written_by_me_prompt(self) -> str:
         prompt = self.WRITTEN_BY_ME_PROMPT
-        prompt = prompt.replace(
-            "{{full_name}}",
-            os.environ.get("AUTHOR_FULL_NAME"),
-        )
-        prompt = prompt.replace(
-            "{{pronoun_two}}",
-            os.environ.get("AUTHOR_PRONOUN_TWO"),
-        )
+        prompt = prompt.replace("{{full_name}}", self.author_full_name)
+        prompt = prompt.replace("{{pronoun_two}}", self.author_pronoun_two)
         return prompt
 
     async def process_chunks(
@@ -105,7 +112,6 @@ class ChunkSummarizer:
                 enhanced context
         """
 
-        processed_chunks = []
         if len(chunks_to_process) == 0:
             return []
 
@@ -117,17 +123,39 @@ class ChunkSummarizer:
         else:
             file_summary = ""
 
-
-        for chunk in chunks_to_process:
-            processed = await self._process_chunk(
-                file_summ_prompt,
-                file_summary,
-                chunk,
-                written_by_me,
-            )
-            processed_chunks.append(processed)
-
-        return processed_chunks
+        system_prompt = self._build_chunk_prompt(file_summ_prompt, written_by_me)
+        self.logger.debug("SYSTEM_PROMPT: %s", system_prompt)
+        # Every chunk shares the same system message, so only the user message
+        # is built per chunk.
+        system_message = {
+            "role": "system",
+            "content": system_prompt,
+        }
+
+        # The chunk summaries are independent of each other, so request them
+        # concurrently, with at most `summarize_concurrency` in flight.
+        semaphore = asyncio.Semaphore(settings.get("summarize_concurrency", 4))
+
+        async def process(chunk: dict) -> dict:
+            async with semaphore:
+                return await self._process_chunk(
+                    system_message,
+                    file_summary,
+                    chunk,
+                )
+
+        # A TaskGroup cancels the remaining summaries as soon as one fails,
+        # instead of leaving them calling the LLM in the background.
+        try:
+            async with asyncio.TaskGroup() as task_group:
+                tasks = [
+                    task_group.create_task(process(chunk))
+                    for chunk in chunks_to_process
+                ]
+        except ExceptionGroup as e:
+            raise e.exceptions[0] from e
+
+        return [task.result() for task in tasks]
 
     async def _get_file_summary(
         self,
@@ -164,34 +192,32 @@ class ChunkSummarizer:
     ) -> str:
         prompt = self.SUMMARIZE_FILE_PROMPT
         if written_by_me:
-            prompt = f"{prompt} {self._parse_written_by_me_prompt()}"
-        print("SYSTEM_PROMPT:", prompt)
+            prompt = f"{prompt} {self.written_by_me_prompt}"
+        self.logger.debug("SYSTEM_PROMPT: %s", prompt)
 
         return await self._send_llm_message(
             system_prompt=prompt,
             message=initial_chunk,
         )
 
-    async def _process_chunk(
-        self,
-        file_summ_prompt: str,
-        file_summary: str,
-        chunk: dict,
-        written_by_me: bool,
-    ) -> dict:
+    def _build_chunk_prompt(self, file_summ_prompt: str, written_by_me: bool) -> str:
         prompt = self.SUMMARIZE_CHUNK_PROMPT
         if written_by_me:
-            prompt = f"{prompt} {self._parse_written_by_me_prompt()}"
+            prompt = f"{prompt} {self.written_by_me_prompt}"
 
         if len(file_summ_prompt) > 0:
             prompt = f"{prompt}\n{file_summ_prompt}"
 
-        print("SYSTEM_PROMPT:", prompt)
+        return prompt
+
+    async def _process_chunk(
+        self,
+        system_message: dict,
+        file_summary: str,
+        chunk: dict,
+    ) -> dict:
         messages = [
-            {
-                "role": "system",
-                "content": prompt,
-            },
+            system_message,
             {
                 "role": "user",
                 "content": chunk["content"],
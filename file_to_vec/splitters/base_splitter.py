@@ -1,6 +1,10 @@
+import re
 from abc import ABC
 from typing import List
 
+_SENTENCE_END_RE = re.compile(r"[.?!]+")
+_SPACES_RE = re.compile(r" *")
+
 
 class BaseSplitter(ABC):
     """
@@ -22,27 +26,35 @@ class BaseSplitter(ABC):
 
         splits = []
         start = 0
-        while start < len(text):
-            segment = text[start:]
+        text_length = len(text)
+        # Work with indices into text rather than slicing off the remaining
+        # tail on every iteration, which would copy O(n^2) characters.
+        while start < text_length:
             # Leave room for overlap by using (chunk_size - chunk_overlap)
             next_pos = self._find_next_position(
-                segment,
+                text,
+                start,
                 chunk_size - chunk_overlap,
             )
 
             overlap = 0
             if start > overlap and chunk_overlap > 0:
                 overlap = self._find_previous_position(
-                    text[: start - 1],
-                    max(chunk_overlap, (chunk_size - len(segment)) * 0.8),
+                    text,
+                    start - 1,
+                    max(chunk_overlap, (chunk_size - (text_length - start)) * 0.8),
                 )
             splits.append(text[start - overlap : start + next_pos])
             start += next_pos + 1
         return splits
 
-    def _find_next_position(self, text: str, max_size: int) -> int:
-        if len(text) <= max_size:
-            return len(text)
+    def _find_next_position(self, text: str, start: int, max_size: int) -> int:
+        """
+        Return the length of the next split starting at start.
+        """
+
+        if len(text) - start <= max_size:
+            return len(text) - start
 
         # Try breaking at a paragraph break, then line, sentence, and finally word.
         for break_fn in [
@@ -51,67 +63,74 @@ class BaseSplitter(ABC):
             self._find_sentence_break,
             self._find_word_break,
         ]:
-            pos = break_fn(text, max_size)
+            pos = break_fn(text, start, max_size)
             if pos != -1:
                 return pos
         return max_size
 
     @staticmethod
-    def _find_previous_position(text: str, overlap: int) -> str:
+    def _find_previous_position(text: str, end: int, overlap: int) -> int:
+        """
+        Find how far back from end the overlap can start: the furthest space
+        within overlap characters before end, counted from end.
+        """
+
         if overlap == 0:
             return 0
 
-        pos = 0
-        for i, c in enumerate(text[::-1]):
-            if i > overlap:
-                break
-
-            if c == " ":
-                pos = i
+        pos = text.find(" ", max(end - 1 - int(overlap), 0), end)
+        if pos == -1:
+            return 1
 
-        return pos + 1
+        return end - pos
 
     @staticmethod
-    def _find_paragraph_break(text: str, max_size: int) -> int:
-        idx = text.find("\n\n")
+    def _find_paragraph_break(text: str, start: int, max_size: int) -> int:
+        # Only a break starting within max_size counts, so don't search past
+        # the window.
+        idx = text.find("\n\n", start, start + max_size + 2) - start
         return idx + 2 if 0 < idx <= max_size else -1
 
     @staticmethod
-    def _find_line_break(text: str, max_size: int) -> int:
-        idx = text.find("\n")
+    def _find_line_break(text: str, start: int, max_size: int) -> int:
+        idx = text.find("\n", start, start + max_size + 1) - start
         return idx + 1 if 0 < idx <= max_size else -1
 
     @staticmethod
-    def _find_sentence_break(text: str, max_size: int) -> int:
-        last_break = -1
-        current = 0
-        while current < len(text) and current < max_size:
-            if text[current] in ".?!":
-                # Advance past any extra punctuation characters.
-                temp = current + 1
-                while temp < len(text) and text[temp] in ".?!":
-                    temp += 1
-                last_break = temp
-            current += 1
-        return last_break
+    def _find_sentence_break(text: str, start: int, max_size: int) -> int:
+        # Search backwards from the end of the window for the last
+        # punctuation character, so only the tail of the window is scanned.
+        end = start + max_size
+        last_punctuation = max(
+            text.rfind(".", start, end),
+            text.rfind("?", start, end),
+            text.rfind("!", start, end),
+        )
+        if last_punctuation == -1:
+            return -1
+
+        # The last run of punctuation may extend past max_size; advance past
+        # all of it.
+        return _SENTENCE_END_RE.match(text, last_punctuation).end() - start
 
     @staticmethod
-    def _find_word_break(text: str, max_size: int) -> int:
+    def _find_word_break(text: str, start: int, max_size: int) -> int:
         """
         Accumulate words until adding the next word (plus a space) would
         push the chunk size to max_size or more. If the very first word is
         longer than max_size, return the full length of that word.
         """
 
-        i = 0
+        i = start
         size = 0
         last_break = 0
+        text_length = len(text)
         # Loop over words in the raw text without collapsing extra spaces.
-        while i < len(text):
+        while i < text_length:
             # Find the end of the current word.
-            j = i
-            while j < len(text) and text[j] != " ":
-                j += 1
+            j = text.find(" ", i)
+            if j == -1:
+                j = text_length
             word_length = j - i
             candidate = size + word_length + 1
 
@@ -120,18 +139,16 @@ class BaseSplitter(ABC):
                 # If this is the first word and it exceeds max_size,
                 # then just return the full word (ignoring max_size).
                 if size == 0:
-                    return j
+                    return j - start
                 break
 
             size = candidate
-            last_break = j
+            last_break = j - start
 
             # Skip following spaces.
-            while j < len(text) and text[j] == " ":
-                j += 1
-            i = j
+            i = _SPACES_RE.match(text, j).end()
 
         if last_break > 0:
             return last_break
 
-        return len(text)
+        return text_length - start
@@ -107,6 +107,75 @@ class BaseSplitterTest(unittest.TestCase):
             )
             self.assertEqual(splits, tc["want_splits"])
 
+    def test_find_sentence_break(self):
+        test_cases = [
+            {
+                "text": "No sentence break here",
+                "max_size": 10,
+                "want_pos": -1,
+            },
+            {
+                "text": "One. Two. Three.",
+                "max_size": 12,
+                "want_pos": 9,
+            },
+            {
+                "text": "Why?! Because",
+                "max_size": 10,
+                "want_pos": 5,
+            },
+            {
+                "text": "Wait... what",
+                "max_size": 6,
+                "want_pos": 7,
+            },
+        ]
+
+        for tc in test_cases:
+            pos = BaseSplitter._find_sentence_break(
+                tc["text"],
+                0,
+                tc["max_size"],
+            )
+            self.assertEqual(pos, tc["want_pos"])
+
+    def test_find_word_break(self):
+        test_cases = [
+            {
+                "text": "This sentence is too long",
+                "max_size": 10,
+                "want_pos": 4,
+            },
+            {
+                "text": "This sentence is too  long  and has",
+                "max_size": 20,
+                "want_pos": 16,
+            },
+            {
+                "text": "Words   with   wide   gaps",
+                "max_size": 14,
+                "want_pos": 12,
+            },
+            {
+                "text": "thisisjustonebigword smol",
+                "max_size": 10,
+                "want_pos": 20,
+            },
+            {
+                "text": "short words",
+                "max_size": 50,
+                "want_pos": 11,
+            },
+        ]
+
+        for tc in test_cases:
+            pos = BaseSplitter._find_word_break(
+                tc["text"],
+                0,
+                tc["max_size"],
+            )
+            self.assertEqual(pos, tc["want_pos"])
+
 
 if __name__ == "__main__":
     unittest.main()
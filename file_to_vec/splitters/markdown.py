@@ -3,8 +3,10 @@ Markdown splitter that breaks markdown into sections, then further into blocks,
 and finally into chunks based on chunk_size and overlap.
 """
 
+import logging
 import os
-from typing import Dict, List, Optional, Tuple
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 from langchain_text_splitters import MarkdownHeaderTextSplitter
 
@@ -12,80 +14,125 @@ from settings import settings
 
 from .base_splitter import BaseSplitter
 
+logger = logging.getLogger(__name__)
+
+
+# Tags every line of a section in one pass by what follows its leading
+# whitespace: "```" for code fences, ">" for quotes, "" for empty lines and
+# None for paragraph lines. [^\S\n] is whitespace as str.isspace sees it,
+# minus the newline that separates lines.
+_LINE_TAG_RE = re.compile(r"^[^\S\n]*(```|>|$)?", re.MULTILINE)
+
+# Whitespace around the line breaks of a joined paragraph.
+_LINE_EDGE_WHITESPACE_RE = re.compile(r"[^\S\n]*\n[^\S\n]*")
+
+# Markdown prefix of each header level in the section metadata, in level order.
+HEADER_PREFIXES = {
+    "Header1": "# ",
+    "Header2": "## ",
+    "Header3": "### ",
+    "Header4": "#### ",
+}
+
+
+class _Block(NamedTuple):
+    """
+    A paragraph, code block or quote of a section, with its size worked out
+    once when it is created.
+    """
+
+    content: str
+    metadata: Dict
+    size: int
+    # Paragraphs may be split further by split_text; code blocks and quotes
+    # are kept whole.
+    splittable: bool
+
 
 class MarkdownSplitter(BaseSplitter):
     """
     Splits the given markdown text into sections and further into blocks and chunks.
     """
 
-    # Line classification methods
+    # Line classification
     @staticmethod
-    def _is_line_quote(line: str) -> bool:
-        return line.lstrip().startswith(">")
+    def _tag_lines(text: str) -> Tuple[List[Optional[str]], List[int]]:
+        """
+        Classifies every line of the text and returns a tuple of:
+        (line tags, line start offsets).
 
-    @staticmethod
-    def _is_line_empty(line: str) -> bool:
-        return not line or line.isspace()
+        The offsets have one extra entry past the end of the text, so line i
+        is always text[offsets[i] : offsets[i + 1] - 1].
+        """
 
-    @staticmethod
-    def _is_code_block_start(line: str) -> bool:
-        return line.lstrip().startswith("```")
+        tags = []
+        offsets = []
+        for m in _LINE_TAG_RE.finditer(text):
+            tags.append(m.group(1))
+            offsets.append(m.start())
+        offsets.append(len(text) + 1)
+        return tags, offsets
 
     # Block finding methods
     @staticmethod
-    def _find_code_block_end(lines: List[str]) -> int:
+    def _find_code_block_end(tags: List[Optional[str]], start: int) -> int:
         """
-        Finds the end of a code block by looking for the next line starting
-        with ```.
+        Finds the end of the code block opened at start by looking for the
+        next code fence. Returns the absolute index just past the closing
+        line, or -1 if the block is never closed.
         """
 
-        return next(
-            (i + 1 for i, l in enumerate(lines) if l.lstrip().startswith("```")),
-            -1,
-        )
+        for i in range(start + 1, len(tags)):
+            if tags[i] == "```":
+                return i + 1
+        return -1
 
-    def _find_quote_block_end(self, lines: List[str]) -> int:
+    @staticmethod
+    def _find_quote_block_end(tags: List[Optional[str]], start: int) -> int:
         """
-        Finds the end index of a block of quote lines.
+        Finds the absolute end index of the block of quote lines starting at
+        start.
         """
 
-        return next(
-            (i for i, l in enumerate(lines) if not self._is_line_quote(l)), len(lines)
-        )
+        for i in range(start, len(tags)):
+            if tags[i] != ">":
+                return i
+        return len(tags)
 
     def _create_code_block(
-        self, lines: List[str], start: int
-    ) -> Tuple[Optional[Dict], int]:
+        self,
+        text: str,
+        tags: List[Optional[str]],
+        offsets: List[int],
+        start: int,
+        metadata: Dict,
+    ) -> Tuple[Optional[_Block], int]:
         """
         Creates a code block from the current line and returns a tuple of:
-        (block dict or None, new index).
+        (block or None, new index).
         """
 
-        end_offset = self._find_code_block_end(lines[start + 1 :])
-        if end_offset > 0:
-            end = start + 1 + end_offset
-            block = {
-                "type": "block",
-                "content": "\n".join(lines[start:end]),
-            }
-            return block, end
+        end = self._find_code_block_end(tags, start)
+        if end > 0:
+            content = text[offsets[start] : offsets[end] - 1]
+            return _Block(content, metadata, len(content), False), end
         return None, start + 1
 
     def _create_quote_block(
         self,
-        lines: List[str],
+        text: str,
+        tags: List[Optional[str]],
+        offsets: List[int],
         start: int,
-    ) -> Tuple[Dict, int]:
+        metadata: Dict,
+    ) -> Tuple[_Block, int]:
         """
         Creates a quote block from the current lines.
         """
 
-        end_offset = self._find_quote_block_end(lines[start:])
-        block = {
-            "type": "block",
-            "content": "\n".join(lines[start : start + end_offset]),
-        }
-        return block, start + end_offset
+        end = self._find_quote_block_end(tags, start)
+        content = text[offsets[start] : offsets[end] - 1]
+        return _Block(content, metadata, len(content), False), end
 
     # Main interface
     def __call__(
@@ -117,147 +164,161 @@ class MarkdownSplitter(BaseSplitter):
     def _preprocess_chunks(chunks):
         for chunk in chunks:
             metadata = chunk["metadata"]
-            headers = []
-            for key in metadata.keys():
-                if key == "Header1":
-                    headers.append(f"# {metadata[key]}")
-                    continue
-                if key == "Header2":
-                    headers.append(f"## {metadata[key]}")
-                    continue
-                if key == "Header3":
-                    headers.append(f"### {metadata[key]}")
-                    continue
-                if key == "Header4":
-                    headers.append(f"#### {metadata[key]}")
-                    continue
-
-            if len(headers) > 0:
-                chunk_headers = (
+            # Walk the header levels rather than the metadata, so headers
+            # always come out in level order.
+            headers = [
+                f"{prefix}{header}"
+                for key, prefix in HEADER_PREFIXES.items()
+                if (header := metadata.get(key)) is not None
+            ]
+
+            if headers:
+                chunk["content"] = (
                     f"<chunk_headers>\n{', '.join(headers)}\n</chunk_headers>"
+                    f"\n\n<chunk_content>\n{chunk['content']}\n</chunk_content>"
                 )
-                chunk_content = f"<chunk_content>\n{chunk['content']}\n</chunk_content>"
-                chunk["content"] = f"{chunk_headers}\n\n{chunk_content}"
 
+            # Chunks of the same section share one metadata dict, so each
+            # chunk gets its own wrapper; FileToVec adds the file path to it
+            # and it is stored as the row's metadata.
             chunk["metadata"] = {
-                "headers": chunk["metadata"],
+                "headers": metadata,
             }
         return chunks
 
     # Chunk assembly
     def _split_into_chunks(
-        self, sections: List[List[Dict]], chunk_size: int, chunk_overlap: int
+        self, sections: List[List[_Block]], chunk_size: int, chunk_overlap: int
     ) -> List[Dict]:
         """
         Combine blocks from sections into chunks based on chunk_size and
         chunk_overlap.
+
+        Blocks are packed greedily: the current chunk is the run of blocks
+        section[start:i], and it is emitted as soon as the next block would
+        push it over chunk_size.
         """
 
         chunks = []
-        current_blocks = []
-        current_size = 0
 
-        def flush_current_chunk():
-            nonlocal current_blocks, current_size, chunks
-            if current_blocks:
-                combined = "\n\n".join(b["content"] for b in current_blocks)
+        for section in sections:
+            if not section:
+                continue
+
+            contents = [block.content for block in section]
+
+            # Most sections fit in a single chunk, which is what the packing
+            # below would produce for them anyway.
+            if sum(block.size for block in section) <= chunk_size:
                 chunks.append(
-                    {
-                        "content": combined,
-                        "metadata": current_blocks[0]["metadata"],
-                    }
+                    self._join_blocks(section, contents, 0, len(section))
                 )
-                current_blocks = []
-                current_size = 0
+                continue
 
-        for section in sections:
-            # Reset per section
-            current_blocks = []
+            start = 0
             current_size = 0
-            for block in section:
-                block_size = len(block["content"])
+
+            for i, block in enumerate(section):
+                block_size = block.size
                 # If block fits in current chunk, add it.
                 if current_size + block_size <= chunk_size:
-                    current_blocks.append(block)
                     current_size += block_size
                     continue
 
-                flush_current_chunk()
+                if start < i:
+                    chunks.append(self._join_blocks(section, contents, start, i))
 
-                # Now, try fitting the block in a fresh chunk.
-                if block_size <= chunk_size:
-                    current_blocks.append(block)
-                    current_size += block_size
-                    continue
-
-                # If block is too big and cannot be split further, force
-                # add it.
-                if block["type"] == "block":
-                    current_blocks.append(block)
-                    current_size += block_size
+                # Start a fresh chunk with this block. If it is too big but
+                # cannot be split further, it is force added on its own.
+                start = i
+                current_size = block_size
+                if block_size <= chunk_size or not block.splittable:
                     continue
 
                 # Otherwise, split the block content using BaseSplitter's
                 # split_text.
                 splits = self.split_text(
-                    text=block["content"],
+                    text=block.content,
                     chunk_size=chunk_size,
                     chunk_overlap=chunk_overlap,
                 )
-                for split in splits:
-                    chunks.append(
-                        {
-                            "content": split,
-                            "metadata": block["metadata"],
-                        }
-                    )
+                chunks.extend(
+                    {"content": split, "metadata": block.metadata}
+                    for split in splits
+                )
+                start = i + 1
+                current_size = 0
 
             # Flush any remaining blocks
-            flush_current_chunk()
+            if start < len(section):
+                chunks.append(
+                    self._join_blocks(section, contents, start, len(section))
+                )
 
         return chunks
 
-    # Section splitting
-    def _split_into_sections(self, text: str):
+    @staticmethod
+    def _join_blocks(
+        section: List[_Block],
+        contents: List[str],
+        start: int,
+        end: int,
+    ) -> Dict:
         """
-        Splits the markdown text into sections based on header markers.
+        Creates a chunk from the blocks section[start:end], joining their
+        precomputed contents in a single pass.
         """
 
-        headers_to_split_on = [
+        return {
+            "content": "\n\n".join(contents[start:end]),
+            "metadata": section[start].metadata,
+        }
+
+    # Section splitting
+    # MarkdownHeaderTextSplitter keeps no state between split_text calls, so
+    # a single instance is shared instead of building one per file.
+    _HEADER_SPLITTER = MarkdownHeaderTextSplitter(
+        headers_to_split_on=[
             ("#", "Header1"),
             ("##", "Header2"),
             ("###", "Header3"),
-        ]
-        splitter = MarkdownHeaderTextSplitter(
-            headers_to_split_on=headers_to_split_on,
-        )
-        return splitter.split_text(text)
+        ],
+    )
+
+    def _split_into_sections(self, text: str):
+        """
+        Splits the markdown text into sections based on header markers.
+        """
+
+        return self._HEADER_SPLITTER.split_text(text)
 
     # Block splitting
     def _split_section_into_blocks(
         self,
         text: str,
         metadata: Dict,
-    ) -> List[Dict]:
+    ) -> List[_Block]:
         """
         Splits a section of markdown text into blocks (paragraphs, code blocks,
         quotes).
         """
 
         blocks = []
-        print("TEXT", text)
-        lines = text.split("\n")
+        logger.debug("TEXT %s", text)
+        # Lines are addressed by their offsets into the text, so code blocks
+        # and quotes are taken as a single slice instead of re-joining lines.
+        tags, offsets = self._tag_lines(text)
         current_paragraph = []
         i = 0
 
-        while i < len(lines):
-            line = lines[i]
+        while i < len(tags):
+            tag = tags[i]
 
-            if self._is_line_empty(line):
+            if tag == "":
                 i += 1
                 continue
 
-            if self._is_code_block_start(line):
+            if tag == "```":
                 if current_paragraph:
                     blocks.append(
                         self._create_paragraph_block(
@@ -266,13 +327,14 @@ class MarkdownSplitter(BaseSplitter):
                         )
                     )
                     current_paragraph = []
-                block, i = self._create_code_block(lines, i)
+                block, i = self._create_code_block(
+                    text, tags, offsets, i, metadata
+                )
                 if block:
-                    block["metadata"] = metadata
                     blocks.append(block)
                 continue
 
-            if self._is_line_quote(line):
+            if tag == ">":
                 if current_paragraph:
                     blocks.append(
                         self._create_paragraph_block(
@@ -281,13 +343,14 @@ class MarkdownSplitter(BaseSplitter):
                         )
                     )
                     current_paragraph = []
-                block, i = self._create_quote_block(lines, i)
-                block["metadata"] = metadata
+                block, i = self._create_quote_block(
+                    text, tags, offsets, i, metadata
+                )
                 blocks.append(block)
                 continue
 
             # Accumulate normal paragraph lines.
-            current_paragraph.append(line.strip())
+            current_paragraph.append(text[offsets[i] : offsets[i + 1] - 1])
             i += 1
 
         if current_paragraph:
@@ -300,13 +363,11 @@ class MarkdownSplitter(BaseSplitter):
         return blocks
 
     @staticmethod
-    def _create_paragraph_block(paragraph: List[str], metadata: Dict) -> Dict:
+    def _create_paragraph_block(paragraph: List[str], metadata: Dict) -> _Block:
         """
-        Creates a paragraph block from accumulated lines.
+        Creates a paragraph block from accumulated lines, stripping the
+        whitespace around every line in one pass over the joined text.
         """
 
-        return {
-            "type": "paragraph",
-            "content": "\n".join(paragraph),
-            "metadata": metadata,
-        }
+        content = _LINE_EDGE_WHITESPACE_RE.sub("\n", "\n".join(paragraph)).strip()
+        return _Block(content, metadata, len(content), True)
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from typing import List
@@ -8,6 +9,7 @@ from database import Supabase
 from file_to_vec import FileToVec
 from file_to_vec.processors import ChunkSummarizer
 from services import DatabaseCleaner, DatabaseService, OllamaService
+from settings import settings
 
 app = FastAPI()
 db_service = DatabaseService()
@@ -23,13 +25,26 @@ def list_all_knowledge_files():
     """
     Lists all the file paths in the data directory and returns a list of file
     paths.
+
+    Walks the tree with os.scandir, which carries each entry's full path and
+    type with it, instead of os.walk. Like os.walk, symlinked directories are
+    not followed and unreadable directories are skipped.
     """
 
-    return [
-        os.path.join(root, file)
-        for root, _, files in os.walk("/data")
-        for file in files
-    ]
+    file_paths = []
+    directories = ["/data"]
+    while directories:
+        try:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    if not entry.is_dir():
+                        file_paths.append(entry.path)
+                    elif not entry.is_symlink():
+                        directories.append(entry.path)
+        except OSError:
+            continue
+
+    return file_paths
 
 
 async def _process_file_paths(
@@ -40,20 +55,38 @@ async def _process_file_paths(
         file_vectorizer = FileToVec(
             database_service=db_service,
         )
+        # One Ollama client and summarizer serve every file in the request,
+        # and the client's connections are closed once the request is done.
+        async with OllamaService() as ollama:
+            summarizer = ChunkSummarizer(llm_service=ollama)
+
+            semaphore = asyncio.Semaphore(settings.get("file_concurrency", 4))
+
+            async def process_file(file_path: str) -> bool:
+                async with semaphore:
+                    return await file_vectorizer(
+                        file_path=file_path,
+                        processor=summarizer,
+                        ollama=ollama,
+                        db_table=db_table,
+                    )
+
+            # A TaskGroup cancels the remaining files as soon as one fails, so
+            # none of them is left running against the closed Ollama service.
+            try:
+                async with asyncio.TaskGroup() as task_group:
+                    tasks = [
+                        task_group.create_task(process_file(file_path))
+                        for file_path in file_paths
+                    ]
+            except ExceptionGroup as e:
+                raise e.exceptions[0] from e
+
+            results = [task.result() for task in tasks]
 
         processed_files = []
         unprocessed_files = []
-
-        for file_path in file_paths:
-            processed = await file_vectorizer(
-                file_path=file_path,
-                processor=ChunkSummarizer(
-                    llm_service=OllamaService(),
-                ),
-                ollama=OllamaService(),
-                db_table=db_table,
-            )
-
+        for file_path, processed in zip(file_paths, results):
             if processed:
                 processed_files.append(file_path)
                 continue
@@ -79,9 +112,8 @@ async def delete_files(request: Request):
     """
 
     body = await request.json()
-    file_paths = body.get("file_paths", [])
-    for path in file_paths:
-        db_service.delete_documents_by_path(f"/data/{path}")
+    file_paths = [f"/data/{p}" for p in body.get("file_paths", [])]
+    db_service.delete_documents_by_paths(file_paths)
 
 
 @app.post("/store/process_all")
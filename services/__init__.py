@@ -1,5 +1,14 @@
 from .database import DatabaseService
 from .database_cleaner import DatabaseCleaner
+from .embedding_cache import EmbeddingCache, MemoryEmbeddingCache
 from .ollama import OllamaService
+from .semantic_cache import SemanticCache
 
-__all__ = ["DatabaseService", "OllamaService", "DatabaseCleaner"]
+__all__ = [
+    "DatabaseService",
+    "OllamaService",
+    "DatabaseCleaner",
+    "EmbeddingCache",
+    "MemoryEmbeddingCache",
+    "SemanticCache",
+]
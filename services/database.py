@@ -2,14 +2,15 @@
 DatabaseService module for interacting with the Supabase vector database.
 """
 
-import hashlib
 import logging
 import os
-from typing import List
+from typing import List, Optional, Set, Union
 
 import httpx
+from postgrest.exceptions import APIError
 
 from database.supabase import Supabase
+from file_to_vec.hashing import hash_text
 from settings import settings
 
 logger = logging.getLogger(__name__)
@@ -29,16 +30,32 @@ class DatabaseService:
         "to accept connections."
     )
 
-    @staticmethod
-    def _hash_text(text: str) -> str:
-        return hashlib.md5(text.encode("utf-8")).hexdigest()
+    HASH_LOOKUP_BATCH_SIZE = 100
+    # File paths are far longer than hashes once URL-encoded, so fewer of them
+    # fit in a request URL.
+    PATH_DELETE_BATCH_SIZE = 20
+    FILES_PAGE_SIZE = 1000
+
+    # PostgREST error codes for a column that doesn't exist, on select and on
+    # insert/update respectively.
+    MISSING_COLUMN_ERROR_CODES = ("42703", "PGRST204")
 
     def __init__(self, db_table: str = None):
         self.logger = logger.getChild(self.__class__.__name__)
         self.db_table = db_table
         self.set_db_table(db_table)
+        # Settings are loaded once per process and are read-only, so debug
+        # mode can't change while the app is running.
+        self._debug_mode = bool(settings.get("debug_mode", False))
+
+        # Tables created before the file_hash column was introduced lack it.
+        # Once that's detected for a table, the unchanged-file check is
+        # skipped for it instead of failing every request.
+        self._tables_without_file_hash: Set[str] = set()
 
-        self.db = Supabase()
+        # Keep the underlying client itself, so queries don't go through the
+        # singleton wrapper on every call.
+        self.db = Supabase().client
 
     def set_db_table(self, db_table: str = None):
         """
@@ -59,7 +76,7 @@ class DatabaseService:
 
     def content_exists_in_database(self, content: str) -> bool:
         """
-        Check if content already exists in the database using MD5 hash
+        Check if content already exists in the database using content hash
         comparison.
 
         Bypasses the check and returns False if debug mode is enabled, allowing
@@ -72,19 +89,21 @@ class DatabaseService:
             bool: True if the content exists in the database, False otherwise
         """
 
-        debug_mode = settings.get("debug_mode", False)
-        if debug_mode:
+        if self._debug_mode:
             return False
 
         try:
-            md5 = self._hash_text(content)
+            content_hash = hash_text(content)
+            # Only the existence of a row matters, so fetch a single id rather
+            # than whole rows with their embeddings.
             response = (
                 self.db.table(self.db_table)
-                .select("*")
+                .select("id")
                 .eq(
                     "content_hash",
-                    md5,
+                    content_hash,
                 )
+                .limit(1)
             ).execute()
             return len(response.data) > 0
         except httpx.ConnectError:
@@ -92,25 +111,63 @@ class DatabaseService:
         except Exception as e:
             raise e
 
+    def get_existing_hashes(self, content_hashes: List[str]) -> Set[str]:
+        """
+        Return the subset of the given content hashes that already exist in
+        the database.
+
+        Looks the hashes up in batches of HASH_LOOKUP_BATCH_SIZE, instead of
+        issuing one query per hash, to keep the request URL within limits.
+        Returns an empty set if debug mode is enabled, matching
+        content_exists_in_database.
+
+        Args:
+            content_hashes: The content hashes to look up
+
+        Returns:
+            Set[str]: The content hashes that are present in the database
+        """
+
+        if self._debug_mode:
+            return set()
+
+        existing = set()
+        try:
+            for i in range(0, len(content_hashes), self.HASH_LOOKUP_BATCH_SIZE):
+                batch = content_hashes[i : i + self.HASH_LOOKUP_BATCH_SIZE]
+                response = (
+                    self.db.table(self.db_table)
+                    .select("content_hash")
+                    .in_("content_hash", batch)
+                    .execute()
+                )
+                existing.update(row["content_hash"] for row in response.data)
+            return existing
+        except httpx.ConnectError:
+            raise ConnectionError(self.SUPABASE_CONNECTION_ERROR)
+        except Exception as e:
+            raise e
+
     def insert(self, data: dict) -> bool:
         """
         Inserts a record into the Supabase table.
 
         This method blindly accepts a data dictionary and inserts it into the
         table. It assumes that all fields in the data are valid columns in the
-        table.
+        table. A content_hash already present in the data is reused instead of
+        encoding and hashing the content again.
 
         :param data: Dictionary containing the data to insert.
         :return: True if the insert was successful, False otherwise.
         """
 
-        debug_mode = settings.get("debug_mode", False)
-        if debug_mode:
+        if self._debug_mode:
             return True
 
         try:
-            data["content_hash"] = self._hash_text(data["content"])
-            response = self.db.table(self.db_table).insert(data).execute()
+            if "content_hash" not in data:
+                data["content_hash"] = hash_text(data["content"])
+            response = self._execute_insert(data)
 
             ids = [record.get("id") for record in response.data if "id" in record]
 
@@ -124,6 +181,60 @@ class DatabaseService:
         except Exception as e:
             raise e
 
+    def insert_many(self, data: List[dict]) -> bool:
+        """
+        Inserts multiple records into the Supabase table in a single request.
+
+        Like insert, this assumes that all fields in each record are valid
+        columns in the table, and reuses any content_hash they already carry.
+
+        :param data: List of dictionaries containing the data to insert.
+        :return: True if every record was inserted, False otherwise.
+        """
+
+        if self._debug_mode or len(data) == 0:
+            return True
+
+        try:
+            for record in data:
+                if "content_hash" not in record:
+                    record["content_hash"] = hash_text(record["content"])
+            response = self._execute_insert(data)
+
+            ids = [record.get("id") for record in response.data if "id" in record]
+
+            if len(ids) != len(data):
+                return False
+
+            self.logger.info(f"Inserted data with ids = {ids}")
+            return True
+        except httpx.ConnectError:
+            raise ConnectionError(self.SUPABASE_CONNECTION_ERROR)
+        except Exception as e:
+            raise e
+
+    def _execute_insert(self, data: Union[dict, List[dict]]):
+        """
+        Inserts one or more records, leaving out file_hash if the table has no
+        such column.
+        """
+
+        records = data if isinstance(data, list) else [data]
+        if self.db_table in self._tables_without_file_hash:
+            for record in records:
+                record.pop("file_hash", None)
+
+        try:
+            return self.db.table(self.db_table).insert(data).execute()
+        except APIError as e:
+            has_file_hash = any("file_hash" in record for record in records)
+            if not has_file_hash or not self._is_missing_file_hash_column(e):
+                raise e
+
+        for record in records:
+            record.pop("file_hash", None)
+        return self.db.table(self.db_table).insert(data).execute()
+
     def delete_documents_by_path(self, path: str):
         """
         Deletes documents from the Supabase table where metadata->>'file_path'
@@ -132,8 +243,7 @@ class DatabaseService:
         :param path: The file path to match in the metadata.
         """
 
-        debug_mode = settings.get("debug_mode", False)
-        if debug_mode:
+        if self._debug_mode:
             self.logger.info(f"MOCK DELETE PATH: {path}")
             return
 
@@ -156,6 +266,41 @@ class DatabaseService:
         except Exception as e:
             raise e
 
+    def delete_documents_by_paths(self, paths: List[str]):
+        """
+        Deletes documents from the Supabase table whose metadata->>'file_path'
+        is any of the provided paths, in batches of PATH_DELETE_BATCH_SIZE.
+
+        :param paths: The file paths to match in the metadata.
+        """
+
+        if self._debug_mode:
+            self.logger.info(f"MOCK DELETE PATHS: {paths}")
+            return
+
+        try:
+            ids = []
+            for i in range(0, len(paths), self.PATH_DELETE_BATCH_SIZE):
+                batch = paths[i : i + self.PATH_DELETE_BATCH_SIZE]
+                response = (
+                    self.db.table(self.db_table)
+                    .delete()
+                    .in_("metadata->>file_path", batch)
+                    .execute()
+                )
+                ids.extend(
+                    record.get("id") for record in response.data if "id" in record
+                )
+
+            if len(ids) == 0:
+                return
+
+            self.logger.info(f"Deleted {len(ids)} rows of data: {ids}")
+        except httpx.ConnectError:
+            raise ConnectionError(self.SUPABASE_CONNECTION_ERROR)
+        except Exception as e:
+            raise e
+
     def delete_document_by_id(self, row_id: int):
         """
         Delete rows by id.
@@ -163,8 +308,7 @@ class DatabaseService:
         :param id: The row_id of the row to delete
         """
 
-        debug_mode = settings.get("debug_mode", False)
-        if debug_mode:
+        if self._debug_mode:
             self.logger.info(f"MOCK DELETE ID: {row_id}")
             return None
 
@@ -187,25 +331,37 @@ class DatabaseService:
         """
         Returns a list of unique file paths found in the metadata of all the
         rows.
+
+        Rows are read in pages of FILES_PAGE_SIZE, ordered by id, so large
+        tables aren't fetched in one response.
         """
 
         try:
-            response = (
-                self.db.table(self.db_table)
-                .select("id", "metadata->>file_path")
-                .execute()
-            )
-
             paths = set()
-            for row in response.data:
-                path = row.get("file_path")
-                if path is None:
-                    # If there's no path in the metadata, just delete the row
-                    self.delete_document_by_id(row.get("id"))
-
-                paths.add(path)
-
-            return list(paths)
+            last_id = None
+            while True:
+                query = self.db.table(self.db_table).select(
+                    "id", "metadata->>file_path"
+                )
+                if last_id is not None:
+                    # Page by id rather than by offset, so rows deleted below
+                    # don't shift later pages.
+                    query = query.gt("id", last_id)
+                response = query.order("id").limit(self.FILES_PAGE_SIZE).execute()
+
+                for row in response.data:
+                    path = row.get("file_path")
+                    if path is None:
+                        # If there's no path in the metadata, just delete the
+                        # row
+                        self.delete_document_by_id(row.get("id"))
+                        continue
+
+                    paths.add(path)
+
+                if len(response.data) < self.FILES_PAGE_SIZE:
+                    return list(paths)
+                last_id = response.data[-1]["id"]
         except httpx.ConnectError:
             raise ConnectionError(self.SUPABASE_CONNECTION_ERROR)
         except Exception as e:
@@ -213,7 +369,7 @@ class DatabaseService:
 
     def get_hashes_by_path(self, path: str) -> List[dict]:
         """
-        Returns a list of md5 hashes associated with a given path.
+        Returns a list of content hashes associated with a given path.
         """
 
         try:
@@ -232,10 +388,12 @@ class DatabaseService:
     def delete_by_content_hash(self, path: str, content_hash: str):
         """
         Deletes rows by a given a file path and content hash combination.
+
+        To delete several hashes of the same path, use delete_by_content_hashes,
+        which does it in one request per batch.
         """
 
-        debug_mode = settings.get("debug_mode", False)
-        if debug_mode:
+        if self._debug_mode:
             self.logger.info(f"MOCK DELETE HASH: {content_hash}")
             return []
 
@@ -247,8 +405,118 @@ class DatabaseService:
                 .eq("content_hash", content_hash)
                 .execute()
             )
+            return response.data
         except httpx.ConnectError:
             raise ConnectionError(self.SUPABASE_CONNECTION_ERROR)
         except Exception as e:
             raise e
-            return response.data
+
+    def delete_by_content_hashes(self, path: str, content_hashes: List[str]):
+        """
+        Deletes all rows of a given file path whose content hash is in the
+        given list, in batches of HASH_LOOKUP_BATCH_SIZE.
+        """
+
+        if self._debug_mode:
+            self.logger.info(f"MOCK DELETE HASHES: {content_hashes}")
+            return []
+
+        deleted = []
+        try:
+            for i in range(0, len(content_hashes), self.HASH_LOOKUP_BATCH_SIZE):
+                batch = content_hashes[i : i + self.HASH_LOOKUP_BATCH_SIZE]
+                response = (
+                    self.db.table(self.db_table)
+                    .delete()
+                    .filter("metadata->>file_path", "eq", path)
+                    .in_("content_hash", batch)
+                    .execute()
+                )
+                deleted.extend(response.data)
+            return deleted
+        except httpx.ConnectError:
+            raise ConnectionError(self.SUPABASE_CONNECTION_ERROR)
+        except Exception as e:
+            raise e
+
+    def get_file_hash_by_path(self, path: str) -> Optional[str]:
+        """
+        Returns the file hash stored for a given path, or None if the path has
+        no rows or its rows don't all carry the same file hash.
+
+        Returns None if debug mode is enabled, or if the table has no
+        file_hash column, so files are always reprocessed.
+        """
+
+        if self._debug_mode or self.db_table in self._tables_without_file_hash:
+            return None
+
+        try:
+            response = (
+                self.db.table(self.db_table)
+                .select("file_hash")
+                .filter("metadata->>file_path", "eq", path)
+                .execute()
+            )
+        except httpx.ConnectError:
+            raise ConnectionError(self.SUPABASE_CONNECTION_ERROR)
+        except APIError as e:
+            if not self._is_missing_file_hash_column(e):
+                raise e
+            return None
+        except Exception as e:
+            raise e
+
+        file_hashes = {row.get("file_hash") for row in response.data}
+        if len(file_hashes) != 1:
+            return None
+        return file_hashes.pop()
+
+    def set_file_hash_by_path(self, path: str, file_hash: str):
+        """
+        Stores the given file hash on all rows of a given path. Does nothing if
+        the table has no file_hash column.
+        """
+
+        if self._debug_mode:
+            self.logger.info(f"MOCK SET FILE HASH: {path} -> {file_hash}")
+            return
+
+        if self.db_table in self._tables_without_file_hash:
+            return
+
+        try:
+            (
+                self.db.table(self.db_table)
+                .update({"file_hash": file_hash})
+                .filter("metadata->>file_path", "eq", path)
+                .execute()
+            )
+        except httpx.ConnectError:
+            raise ConnectionError(self.SUPABASE_CONNECTION_ERROR)
+        except APIError as e:
+            if not self._is_missing_file_hash_column(e):
+                raise e
+        except Exception as e:
+            raise e
+
+    def _is_missing_file_hash_column(self, error: APIError) -> bool:
+        """
+        Check whether an API error is caused by the current table lacking the
+        file_hash column, and if so, stop using the column for that table.
+        """
+
+        if error.code not in self.MISSING_COLUMN_ERROR_CODES:
+            return False
+        if "file_hash" not in (error.message or ""):
+            return False
+
+        if self.db_table not in self._tables_without_file_hash:
+            self.logger.warning(
+                "Table %s has no file_hash column, so unchanged files can't be "
+                "skipped. Add it with: alter table %s add column file_hash text;",
+                self.db_table,
+                self.db_table,
+            )
+            self._tables_without_file_hash.add(self.db_table)
+        return True
@@ -3,6 +3,7 @@ Clean up database entries by removing records that reference non-existent files.
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 
 class DatabaseCleaner:
@@ -18,6 +19,10 @@ class DatabaseCleaner:
         cleaner(db_table="my_documents")
     """
 
+    # Checking whether a file exists is IO bound, so many paths are stat'ed
+    # concurrently.
+    ISFILE_WORKERS = 32
+
     def __init__(self, db_service):
         self.db_service = db_service
 
@@ -41,8 +46,13 @@ class DatabaseCleaner:
         if len(files_on_db) == 0:
             return
 
-        for file in files_on_db:
-            if os.path.isfile(file):
-                continue
+        with ThreadPoolExecutor(max_workers=self.ISFILE_WORKERS) as executor:
+            exists = list(executor.map(os.path.isfile, files_on_db))
+
+        missing_files = [
+            file for file, is_file in zip(files_on_db, exists) if not is_file
+        ]
+        if len(missing_files) == 0:
+            return
 
-            self.db_service.delete_documents_by_path(file)
+        self.db_service.delete_documents_by_paths(missing_files)
@@ -0,0 +1,200 @@
+"""
+Embedding cache module for reusing text embeddings.
+
+MemoryEmbeddingCache keeps the most recently used embeddings in process, and
+EmbeddingCache persists embeddings in a SQLite database. Both are keyed by the
+embedding model and the text, so texts that were embedded before don't need
+another round trip to Ollama.
+"""
+
+import hashlib
+import logging
+import sqlite3
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from settings import resolve_path
+
+logger = logging.getLogger(__name__)
+
+
+def _key(model: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed, on-disk cache of text embeddings.
+
+    Each embedding is stored as packed float32 values under the SHA-256
+    digest of its model name and text.
+
+    Example:
+        cache = EmbeddingCache(".cache/embeddings.sqlite3")
+        cache.put_many(model, texts, embeddings)
+        embeddings = cache.get_many(model, texts)
+    """
+
+    LOOKUP_BATCH_SIZE = 500
+
+    def __init__(self, cache_path: str):
+        self.logger = logger.getChild(self.__class__.__name__)
+        # Relative paths are kept next to pyproject.toml, so the cache is
+        # found again whatever the working directory.
+        self.cache_path = resolve_path(cache_path)
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.connection = sqlite3.connect(self.cache_path)
+        # Several services may use the same cache file at once.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS emb (key BLOB PRIMARY KEY, vec BLOB)"
+        )
+        self.connection.commit()
+
+    def get_many(
+        self,
+        model: str,
+        texts: List[str],
+    ) -> List[Optional[List[float]]]:
+        """
+        Look up the embeddings of the given texts.
+
+        Args:
+            model: The embedding model the embeddings were made with
+            texts: The texts to look up
+
+        Returns:
+            List[Optional[List[float]]]: The embedding of each text, or None
+            for texts that aren't cached
+        """
+
+        keys = [_key(model, text) for text in texts]
+
+        # One query per batch rather than per text, keeping each within
+        # SQLite's limit on query parameters.
+        vecs = {}
+        for i in range(0, len(keys), self.LOOKUP_BATCH_SIZE):
+            batch = keys[i : i + self.LOOKUP_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            vecs.update(
+                self.connection.execute(
+                    f"SELECT key, vec FROM emb WHERE key IN ({placeholders})",
+                    batch,
+                )
+            )
+
+        embeddings = []
+        for key in keys:
+            vec_bytes = vecs.get(key)
+            if vec_bytes is None:
+                embeddings.append(None)
+                continue
+
+            vec = array("f")
+            vec.frombytes(vec_bytes)
+            embeddings.append(vec.tolist())
+        return embeddings
+
+    def put_many(
+        self,
+        model: str,
+        texts: List[str],
+        embeddings: List[List[float]],
+    ):
+        """
+        Store the embeddings of the given texts. Texts that are already cached
+        are left as they are.
+
+        Args:
+            model: The embedding model the embeddings were made with
+            texts: The embedded texts
+            embeddings: The embedding of each text
+        """
+
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO emb (key, vec) VALUES (?, ?)",
+            [
+                (_key(model, text), array("f", embedding).tobytes())
+                for text, embedding in zip(texts, embeddings)
+            ],
+        )
+        self.connection.commit()
+
+    def close(self):
+        """
+        Close the connection to the cache database.
+        """
+
+        self.connection.close()
+
+
+class MemoryEmbeddingCache:
+    """
+    In-process least recently used cache of text embeddings, holding at most
+    maxsize embeddings. It has the same get_many/put_many interface as
+    EmbeddingCache, so it can sit in front of it.
+
+    Like on disk, embeddings are held as packed float32 arrays, taking 4 bytes
+    per value instead of a boxed Python float each, under the SHA-256 digest
+    of their model name and text rather than the text itself.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.embeddings: OrderedDict[bytes, array] = OrderedDict()
+
+    def get_many(
+        self,
+        model: str,
+        texts: List[str],
+    ) -> List[Optional[List[float]]]:
+        """
+        Look up the embeddings of the given texts, marking hits as recently
+        used.
+
+        Args:
+            model: The embedding model the embeddings were made with
+            texts: The texts to look up
+
+        Returns:
+            List[Optional[List[float]]]: The embedding of each text, or None
+            for texts that aren't cached
+        """
+
+        embeddings = []
+        for text in texts:
+            key = _key(model, text)
+            embedding = self.embeddings.get(key)
+            if embedding is None:
+                embeddings.append(None)
+                continue
+
+            self.embeddings.move_to_end(key)
+            embeddings.append(embedding.tolist())
+        return embeddings
+
+    def put_many(
+        self,
+        model: str,
+        texts: List[str],
+        embeddings: List[List[float]],
+    ):
+        """
+        Store the embeddings of the given texts, evicting the least recently
+        used embeddings once the cache is full.
+
+        Args:
+            model: The embedding model the embeddings were made with
+            texts: The embedded texts
+            embeddings: The embedding of each text
+        """
+
+        for text, embedding in zip(texts, embeddings):
+            key = _key(model, text)
+            self.embeddings[key] = array("f", embedding)
+            self.embeddings.move_to_end(key)
+
+        while len(self.embeddings) > self.maxsize:
+            self.embeddings.popitem(last=False)
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from services.embedding_cache import EmbeddingCache, MemoryEmbeddingCache
+
+
+class MemoryEmbeddingCacheTest(unittest.TestCase):
+    def test_get_many(self):
+        cache = MemoryEmbeddingCache(maxsize=4)
+        cache.put_many("m", ["a", "b"], [[0.5, 1.0], [2.0, 0.25]])
+
+        self.assertEqual(
+            cache.get_many("m", ["b", "c", "a"]),
+            [[2.0, 0.25], None, [0.5, 1.0]],
+        )
+        self.assertEqual(cache.get_many("other", ["a"]), [None])
+
+    def test_evicts_least_recently_used(self):
+        cache = MemoryEmbeddingCache(maxsize=2)
+        cache.put_many("m", ["a", "b"], [[1.0], [2.0]])
+        # Looking "a" up makes "b" the least recently used.
+        cache.get_many("m", ["a"])
+        cache.put_many("m", ["c"], [[3.0]])
+
+        self.assertEqual(cache.get_many("m", ["a", "b", "c"]), [[1.0], None, [3.0]])
+        self.assertEqual(len(cache.embeddings), 2)
+
+
+class EmbeddingCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_path = os.path.join(directory.name, "embeddings.sqlite3")
+
+    def open_cache(self) -> EmbeddingCache:
+        cache = EmbeddingCache(self.cache_path)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_persists_embeddings(self):
+        self.open_cache().put_many("m", ["a", "b"], [[0.5, 1.0], [2.0, 0.25]])
+
+        self.assertEqual(
+            self.open_cache().get_many("m", ["b", "c", "a"]),
+            [[2.0, 0.25], None, [0.5, 1.0]],
+        )
+
+    def test_keeps_existing_embeddings(self):
+        cache = self.open_cache()
+        cache.put_many("m", ["a"], [[1.0]])
+        cache.put_many("m", ["a"], [[2.0]])
+
+        self.assertEqual(cache.get_many("m", ["a"]), [[1.0]])
+
+    def test_get_many_in_batches(self):
+        cache = self.open_cache()
+        texts = [str(i) for i in range(EmbeddingCache.LOOKUP_BATCH_SIZE * 2 + 1)]
+        cache.put_many("m", texts[::2], [[float(i)] for i in range(len(texts[::2]))])
+
+        embeddings = cache.get_many("m", texts)
+
+        self.assertEqual(embeddings[::2], [[float(i)] for i in range(len(texts[::2]))])
+        self.assertEqual(embeddings[1::2], [None] * len(texts[1::2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,12 +6,16 @@ allowing for chat operations and retrieval of text embeddings using asynchronous
 HTTP requests.
 """
 
+import asyncio
 import logging
 import os
-from typing import List
+from typing import AsyncIterator, List, Optional
 
 import httpx
+import orjson
 
+from services.embedding_cache import EmbeddingCache, MemoryEmbeddingCache
+from services.semantic_cache import SemanticCache
 from settings import settings
 
 logger = logging.getLogger(__name__)
@@ -29,12 +33,94 @@ class OllamaService:
 
     OLLAMA_CONNECTION_ERROR = (
         "Could not connect to ollama. Check if ollama is running and able to "
-        "accept connections at {{url}}"
+        "accept connections at {url}"
+    )
+
+    # Chat generations can take a while; embeddings should be quicker. A batch
+    # of embeddings gets the time of one embedding per text in it.
+    CHAT_TIMEOUT = httpx.Timeout(180.0)
+    EMBED_TIMEOUT_PER_TEXT = 120.0
+
+    # Shared by all instances, so embeddings are remembered across requests.
+    _MEMORY_EMBEDDING_CACHE = MemoryEmbeddingCache(
+        settings.get("embedding_memory_cache_size", 1024),
     )
 
     def __init__(self, ollama_url: str = None):
         self.logger = logger.getChild(self.__class__.__name__)
         self.ollama_url = ollama_url or os.environ.get("OLLAMA_URL")
+        self._connection_error = self.OLLAMA_CONNECTION_ERROR.format(
+            url=self.ollama_url or "<unset>",
+        )
+
+        # The models don't change while the app is running, so the
+        # environment is only read once.
+        self.default_model = os.environ.get("DEFAULT_MODEL")
+        self.embedding_model = os.environ.get("EMBEDDING_MODEL")
+        # Likewise, settings are loaded once per process and are read-only.
+        self._debug_mode = bool(settings.get("debug_mode", False))
+
+        # One client for the lifetime of the service, so connections to
+        # Ollama are pooled and kept alive between requests instead of being
+        # opened for every call. When Ollama is served over TLS, HTTP/2 lets
+        # concurrent requests share a single connection.
+        self._client = httpx.AsyncClient(
+            base_url=self.ollama_url or "",
+            timeout=self.CHAT_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=32,
+                max_keepalive_connections=32,
+            ),
+            http2=True,
+        )
+
+        # Caps the embedding requests in flight across everything sharing
+        # this service, such as files processed concurrently.
+        self._embed_semaphore = asyncio.Semaphore(
+            settings.get("embed_concurrency", 8),
+        )
+
+        self._max_embed_chars = settings.get("max_embed_chars", 32768)
+
+        # Off unless a path is configured: chunks are embedded together with
+        # their freshly generated summaries, so the same text rarely comes
+        # back, and the cache never evicts.
+        cache_path = settings.get("embedding_cache_path")
+        self._embedding_cache = EmbeddingCache(cache_path) if cache_path else None
+
+        # Off unless a path is configured: a prompt that is merely similar to
+        # an earlier one gets that prompt's response.
+        semantic_cache_path = settings.get("semantic_cache_path")
+        self._semantic_cache = None
+        if semantic_cache_path:
+            self._semantic_cache = SemanticCache(
+                semantic_cache_path,
+                threshold=settings.get("semantic_cache_threshold", 0.86),
+                ttl=settings.get("semantic_cache_ttl", 0),
+                max_entries=settings.get("semantic_cache_max_entries", 1024),
+            )
+
+        # Embedding caches from fastest to slowest.
+        self._embedding_caches = [self._MEMORY_EMBEDDING_CACHE]
+        if self._embedding_cache is not None:
+            self._embedding_caches.append(self._embedding_cache)
+
+    async def aclose(self):
+        """
+        Closes the underlying HTTP client and its pooled connections.
+        """
+
+        await self._client.aclose()
+        if self._embedding_cache is not None:
+            self._embedding_cache.close()
+        if self._semantic_cache is not None:
+            self._semantic_cache.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
 
     def base_url(self) -> str:
         """
@@ -55,14 +141,17 @@ class OllamaService:
         Sends a list of messages to the Ollama API and retrieves the chat
         response.
 
+        If the semantic cache is enabled, the response to an earlier
+        conversation with the same model and earlier messages, and a similar
+        enough final message, is returned instead. In debug mode, the payload
+        is logged and a placeholder response is returned.
+
         Args:
             messages (List[dict]): A list of message dictionaries to send to the
                                    API.
             model (str, optional): The model to use for the chat. If None, it
                                    will use the 'DEFAULT_MODEL' from environment
                                    variables.
-            debug_mode (bool, optional): If True, the payload is printed and a
-                                         placeholder response is returned.
 
         Returns:
             str: The content of the API's chat response.
@@ -71,12 +160,8 @@ class OllamaService:
             ValueError: If the API call fails or returns a non-200 status code.
         """
 
-        debug_mode = settings.get("debug_mode", False)
-
         if model is None:
-            model = os.environ.get("DEFAULT_MODEL")
-
-        url = f"{self.ollama_url}/api/chat"
+            model = self.default_model
 
         data = {
             "model": model,
@@ -84,25 +169,152 @@ class OllamaService:
             "stream": False,
         }
 
-        if debug_mode:
-            print(data)
+        if self._debug_mode:
+            self.logger.debug("Chat payload: %s", data)
             return "Debug mode on. Placeholder response"
 
+        context_hash = None
+        prompt_embedding = None
+        if self._semantic_cache is not None:
+            # Only the final message is embedded. The messages before it,
+            # often a long system prompt shared by many calls, must match
+            # exactly and would otherwise dominate the embedding.
+            context_hash = SemanticCache.context_hash(messages[:-1])
+            prompt_embedding = await self._embed_prompt(messages[-1]["content"])
+
+        if prompt_embedding is not None:
+            cached = self._semantic_cache.lookup(
+                model,
+                context_hash,
+                prompt_embedding,
+            )
+            if cached is not None:
+                return cached
+
         try:
-            async with httpx.AsyncClient(timeout=httpx.Timeout(180.0)) as client:
-                response = await client.post(url, json=data)
+            response = await self._client.post("/api/chat", json=data)
         except httpx.ConnectError as e:
-            raise ConnectionError(
-                self.OLLAMA_CONNECTION_ERROR.replace("{{url}}", self.ollama_url)
+            raise ConnectionError(self._connection_error) from e
+
+        # Error bodies aren't necessarily JSON, so only parse successful
+        # responses.
+        if response.status_code != 200:
+            err = f"{response.status_code}, {response.text}"
+            self.logger.error(err)
+            raise ValueError(err)
+
+        content = orjson.loads(response.content)["message"]["content"]
+        if prompt_embedding is not None:
+            self._semantic_cache.add(
+                model,
+                context_hash,
+                prompt_embedding,
+                content,
             )
+        return content
 
-        if response.status_code == 200:
-            return response.json()["message"]["content"]
+    async def _embed_prompt(self, prompt: str) -> Optional[List[float]]:
+        """
+        Embeds a chat prompt for the semantic cache.
 
-        err = f"{response.status_code}, {response.text}"
-        self.logger.error(err)
+        The cache is only an optimization, so a prompt that can't be embedded,
+        such as an empty one, is a cache miss rather than a failed chat.
+        """
 
-        raise ValueError(err)
+        try:
+            # Prompts are rarely repeated verbatim, so they skip the chunk
+            # embedding caches rather than crowding chunks out of them.
+            return (
+                await self._fetch_embeddings(
+                    self._prepare_embedding_texts([prompt]),
+                    self.embedding_model,
+                    batch_size=1,
+                )
+            )[0]
+        except (ValueError, ConnectionError, httpx.HTTPError) as e:
+            self.logger.warning("Skipping the semantic cache: %s", e)
+            return None
+
+    async def chat_stream(
+        self,
+        messages: List[dict],
+        model: str = None,
+    ) -> AsyncIterator[str]:
+        """
+        Sends a list of messages to the Ollama API and yields the chat
+        response piece by piece, as the model generates it.
+
+        Args:
+            messages (List[dict]): A list of message dictionaries to send to the
+                                   API.
+            model (str, optional): The model to use for the chat. If None, it
+                                   will use the 'DEFAULT_MODEL' from environment
+                                   variables.
+
+        Yields:
+            str: The next piece of the API's chat response.
+
+        Raises:
+            ValueError: If the API call fails or returns a non-200 status code.
+        """
+
+        if model is None:
+            model = self.default_model
+
+        data = {
+            "model": model,
+            "messages": messages,
+            "stream": True,
+        }
+
+        if self._debug_mode:
+            self.logger.debug("Chat payload: %s", data)
+            yield "Debug mode on. Placeholder response"
+            return
+
+        try:
+            async with self._client.stream("POST", "/api/chat", json=data) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    err = f"{response.status_code}, {response.text}"
+                    self.logger.error(err)
+                    raise ValueError(err)
+
+                async for chunk in self._iter_ndjson(response):
+                    if "error" in chunk:
+                        self.logger.error(chunk["error"])
+                        raise ValueError(chunk["error"])
+
+                    content = chunk.get("message", {}).get("content")
+                    if content:
+                        yield content
+                    if chunk.get("done"):
+                        return
+        except httpx.ConnectError as e:
+            raise ConnectionError(self._connection_error) from e
+
+    @staticmethod
+    async def _iter_ndjson(response: httpx.Response) -> AsyncIterator[dict]:
+        """
+        Yields the JSON objects of a newline-delimited JSON response.
+
+        The raw bytes are collected in one reusable buffer and parsed without
+        being decoded to str first.
+        """
+
+        buffer = bytearray()
+        async for data in response.aiter_bytes():
+            buffer.extend(data)
+
+            start = 0
+            while (end := buffer.find(b"\n", start)) != -1:
+                if end > start:
+                    yield orjson.loads(buffer[start:end])
+                start = end + 1
+            del buffer[:start]
+
+        if buffer.strip():
+            yield orjson.loads(buffer)
 
     async def get_embeddings(self, text: str) -> List[float]:
         """
@@ -118,26 +330,122 @@ class OllamaService:
             ValueError: If the API call fails or returns a non-200 status code.
         """
 
-        model = os.environ.get("EMBEDDING_MODEL")
-        url = f"{self.ollama_url}/api/embed"
-        data = {
-            "model": model,
-            "input": text,
-            "stream": False,
-        }
+        return (await self.get_embeddings_many([text]))[0]
 
-        async with httpx.AsyncClient(timeout=httpx.Timeout(120.0)) as client:
-            response = await client.post(url, json=data)
+    async def get_embeddings_many(
+        self,
+        texts: List[str],
+        batch_size: int = 16,
+    ) -> List[List[float]]:
+        """
+        Retrieves the text embeddings of several input strings, sending up to
+        batch_size of them to the Ollama API in a single request.
 
-        try:
-            if response.status_code == 200:
-                return response.json()["embeddings"][0]
-        except httpx.ConnectError as e:
-            raise ConnectionError(
-                self.OLLAMA_CONNECTION_ERROR.replace("{{url}}", self.ollama_url)
-            )
+        Texts found in the in-memory or on-disk embedding cache are not sent
+        at all, and the embeddings of the others are added to both. Texts
+        longer than the max_embed_chars setting are truncated to it.
+
+        Args:
+            texts (List[str]): The input texts for which embeddings are to be
+                               retrieved.
+            batch_size (int, optional): The maximum number of texts per request.
+
+        Returns:
+            List[List[float]]: The embeddings of the texts, in the same order.
 
-        err = f"{response.status_code}, {response.text}"
-        self.logger.error(err)
+        Raises:
+            ValueError: If a text is empty, or if an API call fails or returns
+                        a non-200 status code.
+        """
 
-        raise ValueError(err)
+        model = self.embedding_model
+        texts = self._prepare_embedding_texts(texts)
+
+        embeddings = [None] * len(texts)
+        missing = list(range(len(texts)))
+
+        for level, cache in enumerate(self._embedding_caches):
+            if not missing:
+                return embeddings
+
+            found = cache.get_many(model, [texts[i] for i in missing])
+            hits = [i for i, embedding in zip(missing, found) if embedding is not None]
+            for i, embedding in zip(missing, found):
+                embeddings[i] = embedding
+
+            # Promote hits to the faster caches in front of this one.
+            for faster_cache in self._embedding_caches[:level]:
+                faster_cache.put_many(
+                    model,
+                    [texts[i] for i in hits],
+                    [embeddings[i] for i in hits],
+                )
+
+            missing = [i for i in missing if embeddings[i] is None]
+
+        if not missing:
+            return embeddings
+
+        missing_texts = [texts[i] for i in missing]
+        fetched = await self._fetch_embeddings(missing_texts, model, batch_size)
+        for i, embedding in zip(missing, fetched):
+            embeddings[i] = embedding
+
+        for cache in self._embedding_caches:
+            cache.put_many(model, missing_texts, fetched)
+        return embeddings
+
+    def _prepare_embedding_texts(self, texts: List[str]) -> List[str]:
+        # Catch inputs that would only waste a round trip and model time
+        # before anything is sent.
+        prepared = []
+        for text in texts:
+            if not text or text.isspace():
+                raise ValueError("Cannot get the embeddings of an empty text")
+
+            if len(text) > self._max_embed_chars:
+                self.logger.warning(
+                    "Truncating text of %d characters to %d for embedding",
+                    len(text),
+                    self._max_embed_chars,
+                )
+                text = text[: self._max_embed_chars]
+
+            prepared.append(text)
+        return prepared
+
+    async def _fetch_embeddings(
+        self,
+        texts: List[str],
+        model: str,
+        batch_size: int,
+    ) -> List[List[float]]:
+        embeddings = []
+        for i in range(0, len(texts), batch_size):
+            batch = texts[i : i + batch_size]
+            data = {
+                "model": model,
+                "input": batch,
+                "stream": False,
+            }
+
+            try:
+                async with self._embed_semaphore:
+                    response = await self._client.post(
+                        "/api/embed",
+                        json=data,
+                        timeout=httpx.Timeout(
+                            self.EMBED_TIMEOUT_PER_TEXT * len(batch),
+                        ),
+                    )
+            except httpx.ConnectError as e:
+                raise ConnectionError(self._connection_error) from e
+
+            if response.status_code != 200:
+                err = f"{response.status_code}, {response.text}"
+                self.logger.error(err)
+                raise ValueError(err)
+
+            embeddings.extend(orjson.loads(response.content)["embeddings"])
+
+        return embeddings
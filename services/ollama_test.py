@@ -0,0 +1,193 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import httpx
+import orjson
+
+from services.embedding_cache import MemoryEmbeddingCache
+from services.ollama import OllamaService
+
+
+def ndjson_stream(*pieces: bytes):
+    async def stream():
+        for piece in pieces:
+            yield piece
+
+    return stream()
+
+
+class OllamaServiceTest(unittest.IsolatedAsyncioTestCase):
+    def make_service(self, handler, settings: dict = None) -> OllamaService:
+        transport = httpx.MockTransport(handler)
+        async_client = httpx.AsyncClient
+
+        def client(**kwargs):
+            kwargs.pop("http2", None)
+            return async_client(transport=transport, **kwargs)
+
+        with (
+            patch("services.ollama.httpx.AsyncClient", client),
+            patch("services.ollama.settings", settings or {}),
+            # Each test starts with an empty in-memory cache.
+            patch.object(
+                OllamaService,
+                "_MEMORY_EMBEDDING_CACHE",
+                MemoryEmbeddingCache(),
+            ),
+        ):
+            service = OllamaService(ollama_url="http://ollama.test")
+        self.addAsyncCleanup(service.aclose)
+        return service
+
+    async def collect(self, service: OllamaService) -> list:
+        messages = [{"role": "user", "content": "Hi"}]
+        return [piece async for piece in service.chat_stream(messages, "m")]
+
+    async def test_chat_stream_split_lines(self):
+        lines = b"".join(
+            orjson.dumps(chunk) + b"\n"
+            for chunk in [
+                {"message": {"content": "Hel"}, "done": False},
+                {"message": {"content": "lo"}, "done": False},
+                {"message": {"content": " world"}, "done": False},
+                {"message": {"content": ""}, "done": True},
+            ]
+        )
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.assertTrue(orjson.loads(request.content)["stream"])
+            # Split mid-line, and put several lines in a single piece.
+            return httpx.Response(
+                200,
+                content=ndjson_stream(lines[:10], lines[10:120], lines[120:]),
+            )
+
+        service = self.make_service(handler)
+
+        self.assertEqual(await self.collect(service), ["Hel", "lo", " world"])
+
+    async def test_chat_stream_unterminated_last_line(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            line = orjson.dumps({"message": {"content": "Hi"}, "done": True})
+            return httpx.Response(200, content=ndjson_stream(line))
+
+        service = self.make_service(handler)
+
+        self.assertEqual(await self.collect(service), ["Hi"])
+
+    async def test_chat_stream_error_object(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(
+                200,
+                content=ndjson_stream(
+                    orjson.dumps({"message": {"content": "Hel"}, "done": False}),
+                    b"\n" + orjson.dumps({"error": "model crashed"}) + b"\n",
+                ),
+            )
+
+        service = self.make_service(handler)
+
+        pieces = []
+        with self.assertRaisesRegex(ValueError, "model crashed"):
+            messages = [{"role": "user", "content": "Hi"}]
+            async for piece in service.chat_stream(messages, "m"):
+                pieces.append(piece)
+        self.assertEqual(pieces, ["Hel"])
+
+    async def test_chat_stream_error_status(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(404, text="model not found")
+
+        service = self.make_service(handler)
+
+        with self.assertRaisesRegex(ValueError, "404, model not found"):
+            await self.collect(service)
+
+
+    def cache_path(self, name: str) -> str:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return os.path.join(directory.name, name)
+
+    async def test_get_embeddings_many_promotes_cache_hits(self):
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            texts = orjson.loads(request.content)["input"]
+            requests.append(texts)
+            embeddings = [[float(len(text)), 1.0] for text in texts]
+            return httpx.Response(200, json={"embeddings": embeddings})
+
+        settings = {"embedding_cache_path": self.cache_path("embeddings.sqlite3")}
+        service = self.make_service(handler, settings)
+        await service.get_embeddings_many(["a", "bb"])
+
+        # A new service starts with an empty memory cache, but the same cache
+        # on disk.
+        service = self.make_service(handler, settings)
+        memory_cache = service._embedding_caches[0]
+        embeddings = await service.get_embeddings_many(["a", "bb", "ccc"])
+
+        self.assertEqual(embeddings, [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]])
+        self.assertEqual(requests, [["a", "bb"], ["ccc"]])
+        self.assertEqual(
+            memory_cache.get_many(service.embedding_model, ["a", "bb", "ccc"]),
+            embeddings,
+        )
+
+    def semantic_cache_handler(self, chats: list, embed_status: int = 200):
+        def handler(request: httpx.Request) -> httpx.Response:
+            data = orjson.loads(request.content)
+            if request.url.path == "/api/embed":
+                if embed_status != 200:
+                    return httpx.Response(embed_status, text="embedding failed")
+                embeddings = [[1.0, float(len(text))] for text in data["input"]]
+                return httpx.Response(200, json={"embeddings": embeddings})
+
+            prompt = data["messages"][-1]["content"]
+            chats.append(prompt)
+            return httpx.Response(200, json={"message": {"content": f"re: {prompt}"}})
+
+        return handler
+
+    async def test_chat_semantic_cache(self):
+        chats = []
+        settings = {"semantic_cache_path": self.cache_path("semantic.sqlite3")}
+        service = self.make_service(self.semantic_cache_handler(chats), settings)
+
+        def messages(system: str, prompt: str) -> list:
+            return [
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt},
+            ]
+
+        self.assertEqual(await service.chat(messages("S", "a"), "m"), "re: a")
+        self.assertEqual(await service.chat(messages("S", "a"), "m"), "re: a")
+        self.assertEqual(await service.chat(messages("T", "a"), "m"), "re: a")
+        self.assertEqual(await service.chat(messages("S", "a"), "n"), "re: a")
+        self.assertEqual(await service.chat(messages("S", "abcdef"), "m"), "re: abcdef")
+        self.assertEqual(chats, ["a", "a", "a", "abcdef"])
+        # Prompts stay out of the chunk embedding caches.
+        self.assertEqual(service._embedding_caches[0].embeddings, {})
+
+    async def test_chat_semantic_cache_miss_on_embedding_failure(self):
+        settings = {"semantic_cache_path": self.cache_path("semantic.sqlite3")}
+
+        chats = []
+        service = self.make_service(self.semantic_cache_handler(chats), settings)
+        messages = [{"role": "user", "content": " "}]
+        self.assertEqual(await service.chat(messages, "m"), "re:  ")
+
+        handler = self.semantic_cache_handler(chats, embed_status=400)
+        service = self.make_service(handler, settings)
+        messages = [{"role": "user", "content": "Hi"}]
+        self.assertEqual(await service.chat(messages, "m"), "re: Hi")
+
+        self.assertEqual(chats, [" ", "Hi"])
+        self.assertEqual(service._semantic_cache.entries, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
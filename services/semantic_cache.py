@@ -0,0 +1,193 @@
+"""
+SemanticCache module for reusing chat responses to similar prompts.
+
+Prompts are compared by the cosine similarity of their embeddings, so a prompt
+that only differs superficially from an earlier one can be answered without
+another LLM generation.
+"""
+
+import hashlib
+import logging
+import math
+import operator
+import sqlite3
+import time
+from array import array
+from typing import List, Optional
+
+import orjson
+
+from settings import resolve_path
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    On-disk cache of chat responses, looked up by embedding similarity.
+
+    Entries are kept in a SQLite database and loaded into memory, where the
+    best match for a prompt is found by brute force. Embeddings are stored
+    normalized, so the cosine similarity is a plain dot product.
+
+    Only the final message of a conversation is embedded. The messages before
+    it, such as a system prompt, are matched exactly by their context hash.
+
+    Example:
+        cache = SemanticCache(".cache/semantic.sqlite3", threshold=0.86)
+        context = SemanticCache.context_hash(messages[:-1])
+        response = cache.lookup(model, context, embedding)
+        if response is None:
+            cache.add(model, context, embedding, await generate())
+    """
+
+    def __init__(
+        self,
+        cache_path: str,
+        threshold: float = 0.86,
+        ttl: float = 0,
+        max_entries: int = 1024,
+    ):
+        self.logger = logger.getChild(self.__class__.__name__)
+        # Relative paths are kept next to pyproject.toml, like the embedding
+        # cache.
+        self.cache_path = resolve_path(cache_path)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.connection = sqlite3.connect(self.cache_path)
+        columns = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(sem)")
+        }
+        if columns and "context" not in columns:
+            # Entries from before the context was part of the key could match
+            # a different conversation, so they are dropped.
+            self.connection.execute("DROP TABLE sem")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sem ("
+            "id INTEGER PRIMARY KEY, model TEXT, context TEXT, vec BLOB, "
+            "response TEXT, created REAL)"
+        )
+        self.connection.commit()
+
+        rows = self.connection.execute(
+            "SELECT id, model, context, vec, response, created FROM sem "
+            "ORDER BY id"
+        )
+        self.entries = []
+        for row_id, model, context, vec_bytes, response, created in rows:
+            vec = array("f")
+            vec.frombytes(vec_bytes)
+            self.entries.append((row_id, model, context, vec, response, created))
+
+    @staticmethod
+    def context_hash(messages: List[dict]) -> str:
+        """
+        Hash the messages that precede the prompt, so only conversations with
+        exactly the same context are matched.
+
+        Args:
+            messages: The messages before the final one
+
+        Returns:
+            str: The hex digest of the messages
+        """
+
+        return hashlib.sha256(
+            orjson.dumps(messages, option=orjson.OPT_SORT_KEYS)
+        ).hexdigest()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> array:
+        norm = math.sqrt(math.fsum(x * x for x in embedding)) or 1.0
+        return array("f", (x / norm for x in embedding))
+
+    def lookup(
+        self,
+        model: str,
+        context: str,
+        embedding: List[float],
+    ) -> Optional[str]:
+        """
+        Find the cached response of the most similar prompt.
+
+        Args:
+            model: The chat model the response must have been made with
+            context: The context hash the prompt must have been made in
+            embedding: The embedding of the prompt
+
+        Returns:
+            Optional[str]: The cached response, or None if no unexpired entry
+            of the model and context is more similar than the threshold
+        """
+
+        vec = self._normalize(embedding)
+        oldest = time.time() - self.ttl if self.ttl else None
+
+        best_similarity = self.threshold
+        best_response = None
+        for entry in self.entries:
+            _, entry_model, entry_context, entry_vec, response, created = entry
+            if entry_model != model or entry_context != context:
+                continue
+            if len(entry_vec) != len(vec):
+                continue
+            if oldest is not None and created < oldest:
+                continue
+
+            similarity = sum(map(operator.mul, vec, entry_vec))
+            if similarity > best_similarity:
+                best_similarity = similarity
+                best_response = response
+
+        if best_response is not None:
+            self.logger.debug("Semantic cache hit (%.3f)", best_similarity)
+        return best_response
+
+    def add(
+        self,
+        model: str,
+        context: str,
+        embedding: List[float],
+        response: str,
+    ):
+        """
+        Store the response to a prompt, evicting the oldest entries once the
+        cache holds more than max_entries.
+
+        Args:
+            model: The chat model that made the response
+            context: The context hash of the messages before the prompt
+            embedding: The embedding of the prompt
+            response: The response to the prompt
+        """
+
+        vec = self._normalize(embedding)
+        created = time.time()
+        cursor = self.connection.execute(
+            "INSERT INTO sem (model, context, vec, response, created) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (model, context, vec.tobytes(), response, created),
+        )
+        self.entries.append(
+            (cursor.lastrowid, model, context, vec, response, created)
+        )
+
+        if len(self.entries) > self.max_entries:
+            evicted = self.entries[: -self.max_entries]
+            self.entries = self.entries[-self.max_entries :]
+            self.connection.executemany(
+                "DELETE FROM sem WHERE id = ?",
+                [(entry[0],) for entry in evicted],
+            )
+        self.connection.commit()
+
+    def close(self):
+        """
+        Close the connection to the cache database.
+        """
+
+        self.connection.close()
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from services.semantic_cache import SemanticCache
+
+
+class SemanticCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_path = os.path.join(directory.name, "semantic.sqlite3")
+        self.context = SemanticCache.context_hash(
+            [{"role": "system", "content": "Summarize."}],
+        )
+
+    def open_cache(self, **kwargs) -> SemanticCache:
+        cache = SemanticCache(self.cache_path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_threshold(self):
+        cache = self.open_cache(threshold=0.9)
+        cache.add("m", self.context, [1.0, 0.0], "response")
+
+        # Only the direction counts, not the length.
+        self.assertEqual(cache.lookup("m", self.context, [2.0, 0.1]), "response")
+        self.assertIsNone(cache.lookup("m", self.context, [1.0, 1.0]))
+
+    def test_best_match(self):
+        cache = self.open_cache(threshold=0.5)
+        cache.add("m", self.context, [1.0, 0.0], "first")
+        cache.add("m", self.context, [0.0, 1.0], "second")
+
+        self.assertEqual(cache.lookup("m", self.context, [0.2, 1.0]), "second")
+
+    def test_model_and_context(self):
+        cache = self.open_cache()
+        cache.add("m", self.context, [1.0, 0.0], "response")
+        other_context = SemanticCache.context_hash(
+            [{"role": "system", "content": "Translate."}],
+        )
+
+        self.assertIsNone(cache.lookup("other", self.context, [1.0, 0.0]))
+        self.assertIsNone(cache.lookup("m", other_context, [1.0, 0.0]))
+
+    def test_context_hash(self):
+        messages = [{"role": "system", "content": "Summarize."}]
+        reordered = [{"content": "Summarize.", "role": "system"}]
+
+        self.assertEqual(
+            SemanticCache.context_hash(messages),
+            SemanticCache.context_hash(reordered),
+        )
+        self.assertNotEqual(
+            SemanticCache.context_hash(messages),
+            SemanticCache.context_hash([]),
+        )
+
+    def test_ttl(self):
+        cache = self.open_cache(ttl=60)
+        with patch("services.semantic_cache.time.time", return_value=1000.0):
+            cache.add("m", self.context, [1.0, 0.0], "response")
+
+        with patch("services.semantic_cache.time.time", return_value=1059.0):
+            self.assertEqual(cache.lookup("m", self.context, [1.0, 0.0]), "response")
+        with patch("services.semantic_cache.time.time", return_value=1061.0):
+            self.assertIsNone(cache.lookup("m", self.context, [1.0, 0.0]))
+
+    def test_evicts_oldest_entries(self):
+        cache = self.open_cache(max_entries=2)
+        cache.add("m", self.context, [1.0, 0.0], "first")
+        cache.add("m", self.context, [0.0, 1.0], "second")
+        cache.add("m", self.context, [-1.0, 0.0], "third")
+
+        self.assertEqual(
+            [entry[4] for entry in cache.entries],
+            ["second", "third"],
+        )
+        reopened = self.open_cache()
+        self.assertIsNone(reopened.lookup("m", self.context, [1.0, 0.0]))
+        self.assertEqual(reopened.lookup("m", self.context, [0.0, 1.0]), "second")
+
+    def test_drops_old_schema(self):
+        connection = sqlite3.connect(self.cache_path)
+        connection.execute(
+            "CREATE TABLE sem (id INTEGER PRIMARY KEY, model TEXT, vec BLOB, "
+            "response TEXT, created REAL)"
+        )
+        connection.execute(
+            "INSERT INTO sem (model, vec, response, created) VALUES (?, ?, ?, ?)",
+            ("m", b"\x00\x00\x80\x3f", "stale", 0.0),
+        )
+        connection.commit()
+        connection.close()
+
+        cache = self.open_cache()
+        self.assertEqual(cache.entries, [])
+
+        cache.add("m", self.context, [1.0], "response")
+        self.assertEqual(cache.lookup("m", self.context, [1.0]), "response")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,19 +1,45 @@
 import tomllib
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping, Union
 
+# Resolved next to this module, so settings load the same regardless of the
+# working directory the app or its tests are started from.
+CONFIG_PATH = (Path(__file__).parent / "pyproject.toml").resolve()
 
-def load_settings() -> dict:
+
+@lru_cache(maxsize=1)
+def load_settings() -> Mapping:
     """
     Load application settings from pyproject.toml.
 
+    The file is only parsed on the first call; later calls return the same
+    read-only mapping.
+
+    Returns:
+        Mapping: Configuration settings under the tool.darkrag namespace
+    """
+
+    config = tomllib.loads(CONFIG_PATH.read_bytes().decode("utf-8"))
+    return MappingProxyType(config["tool"]["darkrag"])
+
+
+def resolve_path(path: Union[str, Path]) -> Path:
+    """
+    Resolve a path from the settings.
+
+    Relative paths are taken relative to the directory of pyproject.toml
+    rather than the working directory, like the settings themselves.
+
+    Args:
+        path: The configured path
+
     Returns:
-        dict: Configuration settings under the tool.darkrag namespace
+        Path: The absolute path
     """
 
-    config_path = Path("pyproject.toml")
-    with open(config_path, "rb") as f:
-        config = tomllib.load(f)
-    return config["tool"]["darkrag"]
+    return (CONFIG_PATH.parent / path).resolve()
 
 
 settings = load_settings()